@@ -5,13 +5,15 @@ from . import consts as c, utils, exceptions
 
 class Client(object):
 
-    def __init__(self, api_key, api_secret_key, passphrase, use_server_time=False, first=False):
+    def __init__(self, api_key, api_secret_key, passphrase, use_server_time=False, first=False, session=None):
 
         self.API_KEY = api_key
         self.API_SECRET_KEY = api_secret_key
         self.PASSPHRASE = passphrase
         self.use_server_time = use_server_time
         self.first = first
+        # keep-alive session, can be shared between api objects
+        self.session = session if session is not None else requests.Session()
 
     def _request(self, method, request_path, params, cursor=False):
         if method == c.GET:
@@ -47,14 +49,12 @@ class Client(object):
         # send request
         response = None
         if method == c.GET:
-            response = requests.get(url, headers=header)
-            print("response : ",response.text)
+            response = self.session.get(url, headers=header)
         elif method == c.POST:
-            response = requests.post(url, data=body, headers=header)
-            print("response : ",response.text)
-            #response = requests.post(url, json=body, headers=header)
+            response = self.session.post(url, data=body, headers=header)
+            #response = self.session.post(url, json=body, headers=header)
         elif method == c.DELETE:
-            response = requests.delete(url, headers=header)
+            response = self.session.delete(url, headers=header)
 
         print("status:", response.status_code)
         # exception handle
@@ -84,7 +84,7 @@ class Client(object):
 
     def _get_timestamp(self):
         url = c.API_URL + c.SERVER_TIMESTAMP_URL
-        response = requests.get(url)
+        response = self.session.get(url)
         if response.status_code == 200:
             return response.json()['timestamp']
         else:
@@ -1,7 +1,10 @@
+import asyncio
+import time
+from collections import defaultdict
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Union
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 from dataclasses import dataclass
-from bitget.exceptions import BitgetAPIException
+from bitget.exceptions import BitgetAPIException, BitgetRequestException
 
 @dataclass
 class TradeBill:
@@ -25,6 +28,7 @@ class TradeStatistics:
     usdt_sell_quantity: float
     income: float
     income_percent: float
+    end_ctime: int = 0  # время продажи в мс, 0 - сделка еще открыта
 
 class OrderManager:
     def __init__(self, order_api):
@@ -88,9 +92,13 @@ class OrderManager:
             return {}
 
 class AssetManager:
+    TICKER_CACHE_TTL = 5.0
+
     def __init__(self, account_api, market_api):
         self.account_api = account_api
         self.market_api = market_api
+        # coin -> (время получения по monotonic, цена)
+        self._ticker_cache: Dict[str, Tuple[float, float]] = {}
 
     def get_asset_quantity(self, coin: str) -> float:
         try:
@@ -101,12 +109,44 @@ class AssetManager:
             return 0.0
 
     def get_ticker_price(self, coin: str) -> float:
+        cached = self._ticker_cache.get(coin)
+        if cached and time.monotonic() - cached[0] < self.TICKER_CACHE_TTL:
+            return cached[1]
+
         try:
             response = self.market_api.tickers({"symbol": f"{coin}USDT"})
-            return float(response["data"][0]["lastPr"])
+            price = float(response["data"][0]["lastPr"])
         except BitgetAPIException as e:
             print(f"Error: {e.message}")
             return 0.0
+        except (ValueError, TypeError) as e:
+            print(f"Error: invalid price for {coin}USDT: {e}")
+            return 0.0
+
+        self._ticker_cache[coin] = (time.monotonic(), price)
+        return price
+
+    def get_all_ticker_prices(self, symbols: Iterable[str]) -> Dict[str, float]:
+        """
+        Получает цены нужных пар одним запросом к /tickers
+        :param symbols: символы пар (например, 'BTCUSDT')
+        :return: словарь {символ пары: цена}; пары без цены или с некорректной ценой пропускаются
+        """
+        try:
+            response = self.market_api.tickers({})
+        except BitgetAPIException as e:
+            print(f"Error: {e.message}")
+            return {}
+
+        # Ответ содержит весь рынок - разбираем цены только нужных пар
+        last_prices = {row["symbol"]: row.get("lastPr") for row in response["data"]}
+        prices = {}
+        for symbol in symbols:
+            try:
+                prices[symbol] = float(last_prices[symbol])
+            except (KeyError, ValueError, TypeError):
+                continue
+        return prices
 
     def get_all_assets(self) -> List:
         try:
@@ -116,33 +156,59 @@ class AssetManager:
             return []
 
     def format_assets_message(self, assets: List) -> str:
-        format_message = "Монеты на аккаунте:\n"
-        usdt_message = ""
+        coin_parts: List[str] = ["Монеты на аккаунте:\n"]
+        usdt_parts: List[str] = []
+
+        # Цены всех пар получаем одним запросом вместо запроса на каждую монету
+        prices = self.get_all_ticker_prices(
+            f"{asset['coin']}USDT" for asset in assets if asset["coin"] != "USDT"
+        )
 
         for asset in assets:
-            if asset["available"] == "0.00000000":
+            available = float(asset["available"])
+            if available < 1e-8:
                 continue
 
-            if asset["coin"] != "USDT":
-                price = self.get_ticker_price(asset["coin"])
-                size = round(price * float(asset["available"]), 2)
-                format_message += f"💵{float(asset['available'])} {asset['coin']} ~= {size} USDT💵\n"
+            coin = asset["coin"]
+            if coin != "USDT":
+                price = prices.get(f"{coin}USDT")
+                if price is None:
+                    price = self.get_ticker_price(coin)
+                coin_parts.append(f"💵{available} {coin} ~= {price * available:.2f} USDT💵\n")
             else:
-                usdt_message += f"💲{round(float(asset['available']), 2)} {asset['coin']}💲\n"
+                usdt_parts.append(f"💲{available:.2f} {coin}💲\n")
 
-        return format_message + usdt_message
+        return "".join(coin_parts + usdt_parts)
 
 class BillAnalyzer:
+    BILLS_CACHE_TTL = 30.0
+
     MONTHS = {
         1: "Январь", 2: "Февраль", 3: "Март", 4: "Апрель",
         5: "Май", 6: "Июнь", 7: "Июль", 8: "Август",
         9: "Сентябрь", 10: "Октябрь", 11: "Ноябрь", 12: "Декабрь"
     }
 
+    TRADE_TEMPLATE = (
+        "{status} {coin} ({coin_quantity})\n"
+        "📅 {start_date} - {end_date}\n"
+        "💰 Вход: {usdt_buy_quantity} USDT\n"
+        "💵 Выход: {usdt_sell_quantity} USDT\n"
+        "📊 Прибыль: {income} USDT ({income_percent}%)\n"
+        "⏱ Длительность: {duration} дней\n"
+        + "=" * 30 + "\n"
+    )
+
     def __init__(self, account_api):
         self.account_api = account_api
-
-    def get_account_bills(self, business_type: str, days: int) -> List:
+        # Последняя закрытая сделка по каждой монете, обновляется в process_bills
+        self.last_closed_stat_by_coin: Dict[str, TradeStatistics] = {}
+        # days -> (время запуска расчета по monotonic, задача расчета)
+        self._bills_cache: Dict[int, Tuple[float, asyncio.Future]] = {}
+        self._bills_locks: Dict[int, asyncio.Lock] = {}
+
+    def get_account_bills(self, business_type: str, days: int) -> Optional[List]:
+        """Возвращает счета за days дней или None, если запрос к API не удался"""
         try:
             start_time = int((datetime.now() - timedelta(days)).timestamp() * 1000)
             params = {
@@ -153,14 +219,20 @@ class BillAnalyzer:
             return response["data"]
         except BitgetAPIException as e:
             print(f"error: {e.message}")
-            return ""
+            return None
 
-    def process_bill(self, asset: Dict, usdt_assets: List) -> TradeBill:
-        usdt_quantity = sum(
-            abs(float(usdt_asset["size"]))
-            for usdt_asset in usdt_assets
-            if usdt_asset["coin"] == 'USDT' and usdt_asset["bizOrderId"] == asset["bizOrderId"]
-        )
+    @staticmethod
+    def index_usdt_bills(usdt_bills: List) -> Dict[str, float]:
+        """Суммирует объемы USDT по bizOrderId за один проход"""
+        usdt_by_order: Dict[str, float] = {}
+        for usdt_bill in usdt_bills:
+            if usdt_bill["coin"] == 'USDT':
+                order_id = usdt_bill["bizOrderId"]
+                usdt_by_order[order_id] = usdt_by_order.get(order_id, 0.0) + abs(float(usdt_bill["size"]))
+        return usdt_by_order
+
+    def process_bill(self, asset: Dict, usdt_by_order: Dict[str, float]) -> TradeBill:
+        usdt_quantity = usdt_by_order.get(asset["bizOrderId"], 0.0)
 
         deal = "Покупка" if asset["businessType"] == 'ORDER_DEALT_IN' else "Продажа"
         
@@ -174,47 +246,88 @@ class BillAnalyzer:
             fees=abs(float(asset["fees"]))
         )
 
-    @staticmethod
-    def format_trade_statistics(stat: TradeStatistics) -> str:
+    @classmethod
+    def format_trade_statistics(cls, stat: TradeStatistics) -> str:
         status = "✅" if stat.income > 0 else "❌" if stat.income < 0 else "➡️"
-        return (
-            f"{status} {stat.coin} ({stat.coin_quantity})\n"
-            f"📅 {stat.start_date} - {stat.end_date}\n"
-            f"💰 Вход: {stat.usdt_buy_quantity} USDT\n"
-            f"💵 Выход: {stat.usdt_sell_quantity} USDT\n"
-            f"📊 Прибыль: {stat.income} USDT ({stat.income_percent}%)\n"
-            f"⏱ Длительность: {stat.duration} дней\n"
-            f"{'=' * 30}\n"
-        )
+        # vars() вместо dataclasses.asdict: поля плоские, рекурсивное копирование не нужно
+        return cls.TRADE_TEMPLATE.format_map({**vars(stat), "status": status})
+
+    def invalidate_bills_cache(self) -> None:
+        """Сбрасывает кэш статистики, например после новой сделки"""
+        self._bills_cache.clear()
 
     async def process_bills(self, days: int) -> tuple[List[TradeStatistics], Dict]:
-        # Получаем все сделки
-        buy_bills = self.get_account_bills('ORDER_DEALT_IN', days)
-        sell_bills = self.get_account_bills('ORDER_DEALT_OUT', days)
-        usdt_bills = self.get_account_bills('USDT', days)
+        """
+        Возвращает статистику сделок за days дней.
+        Результат кэшируется на BILLS_CACHE_TTL секунд, одновременные вызовы
+        с одинаковым days ждут один общий расчет.
+        """
+        lock = self._bills_locks.setdefault(days, asyncio.Lock())
+        async with lock:
+            cached = self._bills_cache.get(days)
+            if cached is None or time.monotonic() - cached[0] >= self.BILLS_CACHE_TTL:
+                cached = (time.monotonic(), asyncio.ensure_future(self._compute_bills(days)))
+                self._bills_cache[days] = cached
+
+        future = cached[1]
+        try:
+            # shield: отмена одного из ожидающих не должна отменять общий расчет
+            return await asyncio.shield(future)
+        except Exception:
+            if self._bills_cache.get(days) is cached:
+                del self._bills_cache[days]
+            raise
+
+    async def _compute_bills(self, days: int) -> tuple[List[TradeStatistics], Dict]:
+        # Получаем все сделки параллельно, запросы к API блокирующие
+        buy_bills, sell_bills, usdt_bills = await asyncio.gather(
+            asyncio.to_thread(self.get_account_bills, 'ORDER_DEALT_IN', days),
+            asyncio.to_thread(self.get_account_bills, 'ORDER_DEALT_OUT', days),
+            asyncio.to_thread(self.get_account_bills, 'USDT', days)
+        )
+        # Неполные данные дали бы сделки с нулевым USDT - не кэшируем и не публикуем такой результат
+        if buy_bills is None or sell_bills is None or usdt_bills is None:
+            raise BitgetRequestException("не удалось получить историю счетов")
 
         # Обрабатываем сделки
+        usdt_by_order = self.index_usdt_bills(usdt_bills)
         processed_buy_bills = [
-            self.bill_analyzer.process_bill(bill, usdt_bills)
+            self.process_bill(bill, usdt_by_order)
             for bill in buy_bills
         ]
         processed_sell_bills = [
-            self.bill_analyzer.process_bill(bill, usdt_bills)
+            self.process_bill(bill, usdt_by_order)
             for bill in sell_bills
         ]
 
+        # Группируем продажи по монетам и сортируем по времени,
+        # чтобы искать пару для покупки сдвигом курсора, а не полным перебором
+        sells_by_coin: Dict[str, List[TradeBill]] = defaultdict(list)
+        for sell_bill in processed_sell_bills:
+            sells_by_coin[sell_bill.coin].append(sell_bill)
+        for bucket in sells_by_coin.values():
+            bucket.sort(key=lambda bill: bill.ctime)
+        sell_cursors: Dict[str, int] = defaultdict(int)
+
+        processed_buy_bills.sort(key=lambda bill: bill.ctime)
+
         # Создаем статистику по парам сделок
         stats = []
         coins_in_trade = {}
         
         for buy_bill in processed_buy_bills:
-            # Ищем соответствующую сделку продажи
-            matching_sell = next(
-                (sell for sell in processed_sell_bills 
-                if sell.coin == buy_bill.coin 
-                and sell.ctime > buy_bill.ctime),
-                None
-            )
+            # Ищем первую продажу этой монеты после покупки,
+            # каждая продажа закрывает не более одной покупки
+            bucket = sells_by_coin.get(buy_bill.coin, [])
+            cursor = sell_cursors[buy_bill.coin]
+            while cursor < len(bucket) and bucket[cursor].ctime <= buy_bill.ctime:
+                cursor += 1
+
+            matching_sell = None
+            if cursor < len(bucket):
+                matching_sell = bucket[cursor]
+                cursor += 1
+            sell_cursors[buy_bill.coin] = cursor
             
             stat = self.create_statistics(buy_bill, matching_sell)
             
@@ -223,27 +336,48 @@ class BillAnalyzer:
             else:
                 coins_in_trade[buy_bill.coin] = stat
 
+        for stat in stats:
+            self.last_closed_stat_by_coin[stat.coin] = stat
+
         return stats, coins_in_trade
 
     def create_statistics(self, bill: TradeBill, sell_bill: Optional[TradeBill] = None) -> TradeStatistics:
         buy_date = datetime.fromtimestamp(bill.ctime/1000.0)
-        sell_date = datetime.fromtimestamp(sell_bill.ctime/1000.0) if sell_bill else None
+        start_date = buy_date.strftime("%d.%m.%Y %H:%M")
+        usdt_buy_quantity = round(bill.usdt_quantity + bill.fees, 2)
+
+        if not sell_bill:
+            return TradeStatistics(
+                month=0,
+                year=0,
+                start_date=start_date,
+                end_date="",
+                duration="сделка в процессе",
+                coin=bill.coin,
+                coin_quantity=bill.coin_quantity,
+                usdt_buy_quantity=usdt_buy_quantity,
+                usdt_sell_quantity=0,
+                income=0,
+                income_percent=0
+            )
 
-        usdt_buy_quantity = round(float(bill.usdt_quantity) + float(bill.fees), 2)
-        usdt_sell_quantity = round(float(sell_bill.usdt_quantity) if sell_bill else 0, 2)
+        sell_date = datetime.fromtimestamp(sell_bill.ctime/1000.0)
+        usdt_sell_quantity = round(sell_bill.usdt_quantity, 2)
+        income = usdt_sell_quantity - usdt_buy_quantity
 
         return TradeStatistics(
-            month=int(sell_date.strftime("%m")) if sell_bill else 0,
-            year=int(sell_date.strftime("%Y")) if sell_bill else 0,
-            start_date=buy_date.strftime("%d.%m.%Y %H:%M"),
-            end_date=sell_date.strftime("%d.%m.%Y %H:%M") if sell_bill else "",
-            duration=(sell_date - buy_date).days if sell_bill else "сделка в процессе",
+            month=sell_date.month,
+            year=sell_date.year,
+            start_date=start_date,
+            end_date=sell_date.strftime("%d.%m.%Y %H:%M"),
+            end_ctime=sell_bill.ctime,
+            duration=(sell_date - buy_date).days,
             coin=bill.coin,
-            coin_quantity=float(bill.coin_quantity),
+            coin_quantity=bill.coin_quantity,
             usdt_buy_quantity=usdt_buy_quantity,
             usdt_sell_quantity=usdt_sell_quantity,
-            income=round(usdt_sell_quantity - usdt_buy_quantity, 2) if sell_bill else 0,
-            income_percent=round((usdt_sell_quantity - usdt_buy_quantity) / usdt_buy_quantity * 100, 2) if sell_bill else 0
+            income=round(income, 2),
+            income_percent=round(income / usdt_buy_quantity * 100, 2)
         )
 
     def format_monthly_statistics(self, stats: List[TradeStatistics]) -> str:
@@ -256,12 +390,12 @@ class BillAnalyzer:
             "loss_count": 0, "max_loss_percent": 0
         }
         
-        result = "Статистика по месяцам:\n"
+        parts: List[str] = ["Статистика по месяцам:\n"]
 
         for stat in stats:
             if current_month["month"] != stat.month:
                 if current_month["month"] != 0:
-                    result += self._format_month_summary(current_month, metrics)
+                    parts.append(self._format_month_summary(current_month, metrics))
                     metrics = {
                         "income": 0, "all_percent": 0, "profit_count": 0,
                         "loss_count": 0, "max_loss_percent": 0
@@ -271,9 +405,9 @@ class BillAnalyzer:
             self._update_metrics(metrics, stat)
 
         if current_month["month"] != 0:
-            result += self._format_month_summary(current_month, metrics)
+            parts.append(self._format_month_summary(current_month, metrics))
 
-        return result
+        return "".join(parts)
 
     def _format_month_summary(self, current_month: Dict, metrics: Dict) -> str:
         total_deals = metrics["profit_count"] + metrics["loss_count"]
@@ -1,8 +1,13 @@
 import asyncio
 import json
-import imaplib
+import os
+import re
+import time
 import email
-from typing import List, Dict, Optional
+import aioimaplib
+import requests
+from requests.adapters import HTTPAdapter
+from typing import List, Dict, Optional, Set, Tuple
 from telebot.async_telebot import AsyncTeleBot
 import bitget.v2.spot.order_api as spotOrderApi
 import bitget.v2.spot.account_api as spotAccountApi
@@ -13,69 +18,190 @@ from bitget_functions import OrderManager, AssetManager, BillAnalyzer
 from datetime import datetime as dt
 #import nest_asyncio
 
+# Сигнал - отдельное слово buy/sell, а не часть слов вроде "buyer" или "rebuy"
+_SIGNAL_RE = re.compile(rb"\b(?:buy|sell)\b", re.IGNORECASE)
+_SIDE_RE = re.compile(r"\b(buy|sell)\b", re.IGNORECASE)
+_TOKEN_RE = re.compile(r"[A-Za-z0-9]+")
+_UID_RE = re.compile(rb"UID (\d+)")
+# Суффиксы торговых пар, которые отрезаем от слова при поиске монеты (SOLUSDT, SOLPERP)
+_PAIR_SUFFIXES = ("USDTPERP", "USDT", "PERP")
+
 @dataclass
 class TradingSettings:
     use_fix_deposit: bool
     fix_deposit: float
 
 class ConfigManager:
-    @staticmethod
-    def read_json(name: str = "coins") -> Dict:
-        with open(f"{name}.json", "r") as file:
-            return json.load(file)
-
-    @staticmethod
-    def write_json(json_obj: Dict, name: str = "coins") -> None:
-        with open(f"{name}.json", "w") as file:
+    def __init__(self):
+        # name -> (mtime файла в наносекундах, разобранный JSON)
+        self._cache: Dict[str, Tuple[int, Dict]] = {}
+
+    def read_json(self, name: str = "coins") -> Dict:
+        """Читает JSON-файл, повторно разбирая его только если файл изменился"""
+        path = f"{name}.json"
+        mtime = os.stat(path).st_mtime_ns
+        cached = self._cache.get(name)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        with open(path, "r") as file:
+            data = json.load(file)
+        self._cache[name] = (mtime, data)
+        return data
+
+    def write_json(self, json_obj: Dict, name: str = "coins") -> None:
+        path = f"{name}.json"
+        self._cache.pop(name, None)
+        with open(path, "w") as file:
             file.write(json.dumps(json_obj, indent=4))
+        # Кэшируем записанный объект, чтобы read_json вернул его же, а не разбирал файл заново
+        self._cache[name] = (os.stat(path).st_mtime_ns, json_obj)
 
 class EmailMonitor:
+    IDLE_TIMEOUT = 1740  # RFC 2177: переподключаем IDLE не реже, чем раз в 29 минут
+    RECONNECT_DELAY = 30
+
     def __init__(self, imap_server: str, username: str, password: str):
         self.imap_server = imap_server
         self.username = username
         self.password = password
-
-    async def get_trading_signals(self) -> List[str]:
+        self._imap: Optional[aioimaplib.IMAP4_SSL] = None
+        # Сигналы, отданные в обработку, но еще не помеченные прочитанными
+        self._pending_uids: Set[str] = set()
+        # Письма, которые нужно пометить \Seen при следующей возможности
+        self._seen_uids: Set[str] = set()
+        self._wakeup = asyncio.Event()
+
+    async def _connect(self) -> aioimaplib.IMAP4_SSL:
+        imap = aioimaplib.IMAP4_SSL(host=self.imap_server, port=993)
+        await imap.wait_hello_from_server()
+        await imap.login(self.username, self.password)
+        await imap.select()
+        return imap
+
+    async def _disconnect(self) -> None:
+        if self._imap is None:
+            return
         try:
-            imap = imaplib.IMAP4_SSL(self.imap_server, 993)
-            imap.login(self.username, self.password)
-            imap.select()
-
-            messages = []
-            typ, message_numbers = imap.search(None, "UNSEEN")
-            for num in message_numbers[0].split():
-                typ, msg_data = imap.fetch(num, "(RFC822)")
-                msg = email.message_from_bytes(msg_data[0][1])
-                email_body = msg.get_payload(decode=True).decode()
-                if "buy" in email_body or "sell" in email_body:
-                    messages.append(email_body)
-            imap.logout()
-            return messages
-        except Exception as e:
-            print(f"Ошибка подключения к IMAP: {e}")
+            await self._imap.logout()
+        except Exception:
+            pass
+        self._imap = None
+
+    def mark_seen(self, uid: str) -> None:
+        """Помечает письмо прочитанным после успешной обработки сигнала"""
+        self._seen_uids.add(uid)
+        self._wakeup.set()
+
+    def release(self, uid: str) -> None:
+        """Возвращает письмо в непрочитанные, чтобы обработать его повторно"""
+        self._pending_uids.discard(uid)
+
+    async def _flush_seen(self) -> None:
+        if not self._seen_uids:
+            return
+        uids = set(self._seen_uids)
+        await self._imap.uid("store", ",".join(sorted(uids)), "+FLAGS", "(\\Seen)")
+        self._seen_uids -= uids
+        self._pending_uids -= uids
+
+    @staticmethod
+    def _parse_fetch(lines: List) -> List[Tuple[str, bytes]]:
+        """Разбирает ответ FETCH на пары (UID, тело письма)"""
+        result = []
+        for i, line in enumerate(lines):
+            # Тело письма приходит литералом (bytearray), UID - в соседних строках ответа
+            if not isinstance(line, bytearray) or i == 0:
+                continue
+            match = _UID_RE.search(lines[i - 1])
+            if not match and i + 1 < len(lines):
+                match = _UID_RE.search(lines[i + 1])
+            if match:
+                result.append((match.group(1).decode(), bytes(line)))
+        return result
+
+    async def get_trading_signals(self) -> List[Tuple[str, str]]:
+        """
+        Забирает непрочитанные письма с сигналами через открытое соединение.
+        Письма читаются через BODY.PEEK[] и остаются непрочитанными,
+        пока сигнал не обработан (см. mark_seen).
+        :return: список пар (UID письма, текст сигнала)
+        """
+        if self._imap is None:
+            self._imap = await self._connect()
+        # Сбрасываем до flush: mark_seen, вызванный во время запросов ниже, разбудит следующий IDLE
+        self._wakeup.clear()
+        await self._flush_seen()
+
+        response = await self._imap.uid_search("UNSEEN")
+        uids = [
+            uid.decode() for uid in response.lines[0].split()
+            if uid.decode() not in self._pending_uids
+        ]
+        if not uids:
             return []
 
+        messages = []
+        response = await self._imap.uid("fetch", ",".join(uids), "(BODY.PEEK[])")
+        for uid, raw_message in self._parse_fetch(response.lines):
+            msg = email.message_from_bytes(raw_message)
+            payload = msg.get_payload(decode=True)
+            if not payload or not _SIGNAL_RE.search(payload):
+                self._seen_uids.add(uid)
+                continue
+
+            # Битое письмо не должно ломать весь пакет: помечаем прочитанным и пропускаем
+            try:
+                text = payload.decode(msg.get_content_charset() or "utf-8", errors="replace")
+            except LookupError as e:
+                print(f"Не удалось декодировать письмо {uid}: {e}")
+                self._seen_uids.add(uid)
+                continue
+            messages.append((uid, text))
+
+        await self._flush_seen()
+        return messages
+
+    async def _wait_for_new_mail(self) -> None:
+        """Ждет push-уведомления от сервера в режиме IDLE или вызова mark_seen"""
+        idle_task = await self._imap.idle_start(timeout=self.IDLE_TIMEOUT)
+        push = asyncio.ensure_future(self._imap.wait_server_push())
+        wakeup = asyncio.ensure_future(self._wakeup.wait())
+        try:
+            await asyncio.wait({push, wakeup}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            push.cancel()
+            wakeup.cancel()
+        if self._imap.has_pending_idle():
+            self._imap.idle_done()
+        await asyncio.wait_for(idle_task, timeout=10)
+
+    async def watch(self, queue: asyncio.Queue) -> None:
+        """Держит одно IMAP-соединение и кладет новые сигналы (UID, текст) в неограниченную очередь"""
+        while True:
+            try:
+                for uid, message in await self.get_trading_signals():
+                    # В pending письмо попадает только вместе с постановкой в очередь: если пакет
+                    # не дошел до очереди, письма остаются UNSEEN и будут получены повторно
+                    queue.put_nowait((uid, message))
+                    self._pending_uids.add(uid)
+                await self._wait_for_new_mail()
+            except Exception as e:
+                print(f"Ошибка подключения к IMAP: {e}")
+                await self._disconnect()
+                await asyncio.sleep(self.RECONNECT_DELAY)
+
 class TradingBot:
     def __init__(self):
         self.bot = AsyncTeleBot(creds.TELEGRAM_API_KEY)
-        self.order_manager = OrderManager(
-            spotOrderApi.OrderApi(
-                creds.BITGET_API_KEY, creds.BITGET_SECRET_KEY, creds.BITGET_PASSPHRASE
-            )
-        )
-        self.asset_manager = AssetManager(
-            spotAccountApi.AccountApi(
-                creds.BITGET_API_KEY, creds.BITGET_SECRET_KEY, creds.BITGET_PASSPHRASE
-            ),
-            spotMarketApi.MarketApi(
-                creds.BITGET_API_KEY, creds.BITGET_SECRET_KEY, creds.BITGET_PASSPHRASE
-            )
-        )
-        self.bill_analyzer = BillAnalyzer(
-            spotAccountApi.AccountApi(
-                creds.BITGET_API_KEY, creds.BITGET_SECRET_KEY, creds.BITGET_PASSPHRASE
-            )
-        )
+        # Одна сессия с пулом соединений на все API, чтобы не делать TLS-рукопожатие на каждый запрос
+        self.http_session = requests.Session()
+        self.http_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+        account_api = self._create_api(spotAccountApi.AccountApi)
+        self.order_manager = OrderManager(self._create_api(spotOrderApi.OrderApi))
+        self.asset_manager = AssetManager(account_api, self._create_api(spotMarketApi.MarketApi))
+        self.bill_analyzer = BillAnalyzer(account_api)
         self.email_monitor = EmailMonitor(
             creds.IMAP_SERVER, creds.EMAIL_USERNAME, creds.EMAIL_PASSWORD
         )
@@ -88,6 +214,12 @@ class TradingBot:
             self.config
         )
 
+    def _create_api(self, api_class):
+        return api_class(
+            creds.BITGET_API_KEY, creds.BITGET_SECRET_KEY, creds.BITGET_PASSPHRASE,
+            session=self.http_session
+        )
+
     async def setup_bot_commands(self):
         @self.bot.message_handler(commands=["start", "help"])
         async def send_welcome(message):
@@ -101,8 +233,9 @@ class TradingBot:
 
         @self.bot.message_handler(commands=["assets"])
         async def send_assets(message):
-            assets = self.asset_manager.get_all_assets()
-            await self.bot.reply_to(message, self.asset_manager.format_assets_message(assets))
+            assets = await asyncio.to_thread(self.asset_manager.get_all_assets)
+            assets_message = await asyncio.to_thread(self.asset_manager.format_assets_message, assets)
+            await self.bot.reply_to(message, assets_message)
 
         @self.bot.message_handler(commands=["ostat"])
         async def send_order_statistics(message):
@@ -110,21 +243,21 @@ class TradingBot:
             try:
                 stats, coins_in_trade = await self.bill_analyzer.process_bills(10)
                 
-                response = "📊 Статистика сделок за 10 дней:\n\n"
+                parts = ["📊 Статистика сделок за 10 дней:\n\n"]
                 
                 if stats:
                     for stat in stats:
-                        response += self.bill_analyzer.format_trade_statistics(stat)
+                        parts.append(self.bill_analyzer.format_trade_statistics(stat))
                 
                 if coins_in_trade:
-                    response += "\n📈 Активные сделки:\n"
+                    parts.append("\n📈 Активные сделки:\n")
                     for stat in coins_in_trade.values():
-                        response += self.bill_analyzer.format_trade_statistics(stat)
+                        parts.append(self.bill_analyzer.format_trade_statistics(stat))
                         
                 if not stats and not coins_in_trade:
-                    response += "Нет данных о сделках за указанный период"
+                    parts.append("Нет данных о сделках за указанный период")
                     
-                await self.bot.reply_to(message, response)
+                await self.bot.reply_to(message, "".join(parts))
             except Exception as e:
                 error_message = f"❌ Ошибка при получении статистики: {str(e)}"
                 await self.bot.reply_to(message, error_message)
@@ -146,12 +279,21 @@ class TradingBot:
                 await self.bot.reply_to(message, error_message)
 
     async def trading_loop(self):
-        while True:
-            market_info = self.config.read_json()
-            messages = await self.email_monitor.get_trading_signals()
-            for msg in messages:
-                await self.signal_processor.process_trading_signal(msg, market_info)
-            await asyncio.sleep(300)
+        signals: asyncio.Queue = asyncio.Queue()
+        monitor_task = asyncio.create_task(self.email_monitor.watch(signals))
+        try:
+            while True:
+                uid, msg = await signals.get()
+                try:
+                    market_info = self.config.read_json()
+                    await self.signal_processor.process_trading_signal(msg, market_info)
+                except Exception as e:
+                    print(f"Ошибка при обработке сигнала: {e}")
+                    self.email_monitor.release(uid)
+                    continue
+                self.email_monitor.mark_seen(uid)
+        finally:
+            monitor_task.cancel()
 
     async def start(self):
         await self.setup_bot_commands()
@@ -160,12 +302,27 @@ class TradingBot:
         await asyncio.gather(loop_task, polling_task)
 
 class TradingSignalProcessor:
+    SELL_NOTIFICATION_ATTEMPTS = 3
+    SELL_NOTIFICATION_RETRY_DELAY = 5
+    CLOCK_SKEW_MS = 60_000
+
     def __init__(self, bot, order_manager, asset_manager, bill_analyzer, config):
         self.bot = bot
         self.order_manager = order_manager
         self.asset_manager = asset_manager
         self.bill_analyzer = bill_analyzer
         self.config = config
+        self._market_info: Optional[List[dict]] = None
+        self._coin_by_name: Dict[str, dict] = {}
+        self._not_in_trade_count = 0
+
+    def load_market_info(self, market_info: List[dict]) -> None:
+        """Перестраивает индекс монет и счетчик свободных монет, только если список монет был перечитан"""
+        if market_info is self._market_info:
+            return
+        self._market_info = market_info
+        self._coin_by_name = {info["coin"]: info for info in market_info}
+        self._not_in_trade_count = sum(1 for info in market_info if not info["in_trade"])
 
     async def process_trading_signal(self, message: str, market_info: List[dict]) -> None:
         """Основной метод обработки торговых сигналов"""
@@ -173,90 +330,118 @@ class TradingSignalProcessor:
         if not coin_info:
             return
 
+        # Направление берем из того же шаблона, что и фильтр писем
+        side_match = _SIDE_RE.search(message)
+        if not side_match:
+            return
+
         signal_parts = message.split(" @ ")
-        if "sell" in message:
+        if side_match.group(1).lower() == "sell":
             await self._handle_sell_signal(coin_info, signal_parts, market_info)
-        elif "buy" in message:
+        else:
             await self._handle_buy_signal(coin_info, market_info)
 
     def _find_coin_info(self, message: str, market_info: List[dict]) -> Optional[dict]:
         """Поиск информации о монете из сигнала"""
-        return next(
-            (info for info in market_info if info["coin"] in message),
-            None
-        )
+        self.load_market_info(market_info)
+        for token in _TOKEN_RE.findall(message):
+            info = self._coin_by_name.get(token)
+            if info is None:
+                for suffix in _PAIR_SUFFIXES:
+                    if token.endswith(suffix):
+                        info = self._coin_by_name.get(token[:-len(suffix)])
+                        break
+            if info is not None:
+                return info
+        return None
 
     async def _handle_sell_signal(self, coin_info: dict, signal_parts: List[str], market_info: List[dict]) -> None:
         if not coin_info["in_trade"]:
             return
 
-        quantity = self._prepare_sell_quantity(coin_info)
+        quantity = await self._prepare_sell_quantity(coin_info)
         if not quantity:
             return
 
-        success = self._execute_sell_order(coin_info, quantity, market_info)
+        order_time = int(time.time() * 1000)
+        success = await self._execute_sell_order(coin_info, quantity, market_info)
         if success and len(signal_parts) == 3:
-            await self._send_sell_notification(signal_parts[0])
+            await self._send_sell_notification(coin_info["coin"], order_time)
 
-    def _prepare_sell_quantity(self, coin_info: dict) -> Optional[float]:
+    async def _prepare_sell_quantity(self, coin_info: dict) -> Optional[float]:
         try:
-            quantity = self.asset_manager.get_asset_quantity(coin_info["coin"])
+            quantity = await asyncio.to_thread(self.asset_manager.get_asset_quantity, coin_info["coin"])
             adjusted_quantity = quantity * 0.99  
             return round(float(adjusted_quantity), coin_info["decimals"])
         except Exception as e:
             print(f"Ошибка при подготовке количества для продажи: {e}")
             return None
 
-    def _execute_sell_order(self, coin_info: dict, quantity: float, market_info: List[dict]) -> bool:
+    async def _execute_sell_order(self, coin_info: dict, quantity: float, market_info: List[dict]) -> bool:
         try:
-            order_id = self.order_manager.sell(coin_info["coin"], quantity)
+            order_id = await asyncio.to_thread(self.order_manager.sell, coin_info["coin"], quantity)
             if order_id:
                 coin_info["in_trade"] = False
+                self._not_in_trade_count += 1
                 self.config.write_json(market_info)
+                self.bill_analyzer.invalidate_bills_cache()
                 return True
             return False
         except Exception as e:
             print(f"Ошибка при выполнении ордера на продажу: {e}")
             return False
 
-    async def _send_sell_notification(self, coin_signal: str) -> None:
-        """Отправка уведомления о продаже"""
+    async def _send_sell_notification(self, coin: str, order_time: int) -> None:
+        """
+        Отправка уведомления о продаже
+        :param order_time: время отправки ордера в мс; сделки, закрытые раньше, не считаются
+        """
         try:
-            stats, _ = await self.bill_analyzer.process_bills(10)
-            if stats:
-                for stat in reversed(stats):
-                    if coin_signal in stat["coin"]:
-                        info_message = self.bill_analyzer.format_trade_statistics(stat)
-                        await self.bot.send_message(creds.TELEGRAM_ID, info_message)
-                        break
+            for attempt in range(self.SELL_NOTIFICATION_ATTEMPTS):
+                if attempt:
+                    # Биржа могла еще не выложить счет по продаже - ждем и запрашиваем заново
+                    await asyncio.sleep(self.SELL_NOTIFICATION_RETRY_DELAY)
+                    self.bill_analyzer.invalidate_bills_cache()
+
+                await self.bill_analyzer.process_bills(10)
+                stat = self.bill_analyzer.last_closed_stat_by_coin.get(coin)
+                # Допуск на расхождение локальных часов с биржей
+                if stat and stat.end_ctime >= order_time - self.CLOCK_SKEW_MS:
+                    info_message = self.bill_analyzer.format_trade_statistics(stat)
+                    await self.bot.send_message(creds.TELEGRAM_ID, info_message)
+                    return
+
+            print(f"Не найдена закрытая сделка по {coin} для уведомления о продаже")
         except Exception as e:
             print(f"Ошибка при отправке уведомления о продаже: {e}")
-            self.bot.send_message(creds.TELEGRAM_ID, f"Ошибка при отправке уведомления о продаже: {e}")
+            await self.bot.send_message(creds.TELEGRAM_ID, f"Ошибка при отправке уведомления о продаже: {e}")
 
     async def _handle_buy_signal(self, coin_info: dict, market_info: List[dict]) -> None:
         """Обработка сигнала на покупку"""
         if coin_info["in_trade"]:
             return
 
-        trade_amount = self._calculate_trade_amount(market_info)
+        trade_amount = await self._calculate_trade_amount(market_info)
         if not trade_amount:
             return
 
-        success = self._execute_buy_order(coin_info, trade_amount, market_info)
+        success = await self._execute_buy_order(coin_info, trade_amount, market_info)
         if success:
             await self._send_buy_notification(coin_info, trade_amount)
 
-    def _calculate_trade_amount(self, market_info: List[dict]) -> Optional[float]:
+    async def _calculate_trade_amount(self, market_info: List[dict]) -> Optional[float]:
         """Расчет суммы для торговли"""
         try:
-            settings = self.config.read_json("settings")
-            usdt_balance = self.asset_manager.get_asset_quantity("USDT")
+            self.load_market_info(market_info)
+            settings, usdt_balance = await asyncio.gather(
+                asyncio.to_thread(self.config.read_json, "settings"),
+                asyncio.to_thread(self.asset_manager.get_asset_quantity, "USDT")
+            )
 
             if settings.get("useFixDeposit"):
                 return float(settings["fixDeposit"])
         
-            coins_not_in_trade = sum(1 for coin in market_info if not coin["in_trade"])
-            coef = 0.95 / max(coins_not_in_trade, 1)
+            coef = 0.95 / max(self._not_in_trade_count, 1)
             amount = round(float(usdt_balance) * coef, 2)
         
             return max(amount, 5.02)
@@ -264,12 +449,14 @@ class TradingSignalProcessor:
             print(f"Ошибка при расчете суммы для торговли: {e}")
             return 7.0
 
-    def _execute_buy_order(self, coin_info: dict, amount: float, market_info: List[dict]) -> bool:
+    async def _execute_buy_order(self, coin_info: dict, amount: float, market_info: List[dict]) -> bool:
         try:
-            order_id = self.order_manager.buy(coin_info["coin"], amount)
+            order_id = await asyncio.to_thread(self.order_manager.buy, coin_info["coin"], amount)
             if order_id:
                 coin_info["in_trade"] = True
+                self._not_in_trade_count -= 1
                 self.config.write_json(market_info)
+                self.bill_analyzer.invalidate_bills_cache()
                 return True
             return False
         except Exception as e: